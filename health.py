@@ -1,122 +1,1253 @@
+import plotly
 import plotly.graph_objects as go
 import pandas as pd
 from plotly.subplots import make_subplots
 import os
+import re
+import glob
+import argparse
+import json
+import time
+import hashlib
+import sqlite3
+import unicodedata
+from bisect import bisect_left
+from itertools import islice
 import numpy as np
 from datetime import datetime
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import readline
+except ImportError:  # Not available on every platform; autocomplete is skipped
+    readline = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # Only needed for Arrow output (export_dashboard_arrow)
+    pa = None
+
+# Default CSV file with the IHME health spending data
+DATA_FILE = 'upload example data.CSV'
+
+# Default year window for the dashboards: the last two decades (2003-2021)
+DEFAULT_YEAR_RANGE = (2003, 2021)
+
+# Measures available on the dashboard: (label, column, color)
+FUNDING_SOURCES = [
+    ('Total Health Expenditure', 'the_total_mean', '#3B82F6'),  # Modern blue
+    ('Government Health Expenditure', 'ghes_total_mean', '#EF4444'),  # Modern red
+    ('Prepaid Private Plans', 'ppp_total_mean', '#10B981'),  # Modern green
+    ('Out-of-Pocket Spending', 'oop_total_mean', '#F59E0B'),  # Modern amber
+    ('Development Assistance for Health', 'dah_total_mean', '#8B5CF6')  # Modern purple
+]
+
+# Column names used by some extracts, mapped to the names used here
+COLUMN_ALIASES = {
+    'year_id': 'year',
+    'location': 'location_name'
+}
+
+# Components of total health expenditure shown in the funding composition bar
+FUNDING_COLUMNS = ['ghes_total_mean', 'ppp_total_mean', 'oop_total_mean', 'dah_total_mean']
+
+# Files with the reference tables used to normalize spending (see load_reference_tables)
+POPULATION_FILE = 'population.csv'  # location_name, year, population
+DEFLATOR_FILE = 'deflators.csv'  # year, deflator (1.0 in the base year), optionally by location_name
+PPP_FILE = 'ppp_factors.csv'  # location_name, year, ppp_factor (multiplier from USD to international $)
+
+# Ways to present spending: which reference factors to apply, and how to display the result
+NORMALIZATION_VARIANTS = {
+    'nominal': dict(factors=[], scale=1000000, unit='M', axis_title='Spending (Millions USD)'),
+    'per_capita': dict(factors=['population'], scale=1, unit='',
+                       axis_title='Spending per Capita (USD)'),
+    'constant': dict(factors=['deflator'], scale=1000000, unit='M',
+                     axis_title='Spending (Millions Constant USD)'),
+    'constant_per_capita': dict(factors=['deflator', 'population'], scale=1, unit='',
+                                axis_title='Spending per Capita (Constant USD)'),
+    'ppp': dict(factors=['ppp'], scale=1000000, unit='M',
+                axis_title='Spending (Millions International $, PPP)'),
+    'ppp_per_capita': dict(factors=['ppp', 'population'], scale=1, unit='',
+                           axis_title='Spending per Capita (International $, PPP)')
+}
+
+# On-disk cache of rendered figures and stat cards, shared across runs (see figure_cache_put)
+FIGURE_CACHE_DIR = '.dashboard_cache'
+FIGURE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Loaded data, sorted by year (see load_data)
+df = None
+
+# Raw reference tables; they outlive load_data, unlike the aligned arrays in _cache
+reference_tables = {}
+
+# Parsed CSV files with the (mtime, size) they were read at, so reloads skip unchanged files
+_parsed_files = {}
+
+# Open figure cache databases by directory, and the fingerprint of this template
+_figure_cache_connections = {}
+_template_fingerprint = None
+
+# Directory holding the memory-mapped draw-level store (see build_draw_store)
+DRAW_STORE_DIR = 'draw_store'
+
+# Location hierarchy with location_id, location_name and parent_id columns
+HIERARCHY_FILE = 'location_hierarchy.csv'
+
+# Values derived from df (rollups, row indexes, ...), computed once and reused
+_cache = {}
+
+
+# Function to list the CSV files behind a data path: a file, a directory (every CSV in it),
+# a glob pattern such as 'extracts/*_2021.csv', or a list of any of these
+def data_files(path):
+    if isinstance(path, (list, tuple)):
+        files = []
+        for item in path:
+            files.extend(data_files(item))
+        return list(dict.fromkeys(files))
+
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith('.csv')
+        )
 
-# Load data from CSV file
-df = pd.read_csv('upload example data
-.CSV')
+    if any(ch in path for ch in '*?['):
+        return sorted(glob.glob(path))
 
-# Filter data for the last two decades (2003-2021)
-df = df[df['year'].between(2003, 2021)]
+    return [path]
 
 
-# Function to generate HTML with custom dashboard
-def generate_dashboard(selected_location):
-    # Filter data for the selected location
-    df_location = df[df['location_name'] == selected_location]
+# Function to parse one CSV file with harmonized column names (runs in worker processes)
+def _parse_csv(path):
+    frame = pd.read_csv(path)
+    frame.columns = [COLUMN_ALIASES.get(col, col) for col in frame.columns.str.strip().str.lower()]
 
-    if df_location.empty:
-        print(f"No data found for '{selected_location}'. Please check the spelling or choose another location.")
+    return frame
+
+
+# Function to read CSV files, reusing parsed frames while a file is unchanged. Files that
+# need parsing are spread over worker processes (workers=None uses one per CPU, 1 parses
+# in this process).
+def _read_csv_files(files, workers=None):
+    versions = {}
+    stale = []
+    for file in files:
+        stat = os.stat(file)
+        versions[file] = (stat.st_mtime_ns, stat.st_size)
+        cached = _parsed_files.get(file)
+        if cached is None or cached[0] != versions[file]:
+            stale.append(file)
+
+    if stale:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(stale))
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = list(pool.map(_parse_csv, stale))
+        else:
+            parsed = [_parse_csv(file) for file in stale]
+
+        for file, frame in zip(stale, parsed):
+            _parsed_files[file] = (versions[file], frame)
+
+    return [_parsed_files[file][1] for file in files]
+
+
+# Function to merge frames from several files into one. Columns missing from a file become
+# NaN, measures are made numeric, and rows without a location or year are dropped. When files
+# overlap on (location, year), the row from the file listed last wins, so the result only
+# depends on the file order, not on which worker finished first.
+def merge_frames(frames):
+    frame = pd.concat(frames, ignore_index=True, sort=False)
+
+    measure_columns = [col for col in frame.columns if col.endswith(('_mean', '_lower', '_upper'))]
+    frame[measure_columns] = frame[measure_columns].apply(pd.to_numeric, errors='coerce')
+    frame['year'] = pd.to_numeric(frame['year'], errors='coerce')
+    frame = frame.dropna(subset=['location_name', 'year'])
+    frame['year'] = frame['year'].astype(int)
+
+    return frame.drop_duplicates(['location_name', 'year'], keep='last')
+
+
+# Function to load the data once and keep it sorted by year, so any year window can be
+# selected with a binary search instead of re-filtering the frame. path is anything
+# data_files accepts; files are parsed in parallel and files that did not change since the
+# last load are not re-parsed.
+# The data-quality scan runs right away, so problems are reported before any rendering.
+def load_data(path=DATA_FILE, workers=None):
+    global df
+
+    files = data_files(path)
+    if not files:
+        raise FileNotFoundError(f"No CSV files found for {path!r}")
+
+    frames = _read_csv_files(files, workers)
+    df = merge_frames(frames).sort_values('year', kind='stable', ignore_index=True)
+    _cache.clear()
+    get_validation_report()
+    get_cube()
+
+    return df
+
+
+# Function to time a full (uncached) load of path with different numbers of worker processes.
+# Each file is parsed by one process, so the effective count never exceeds the number of
+# files; counts that would repeat an effective count already timed are skipped.
+def benchmark_load(path=DATA_FILE, worker_counts=(1, 4, 8)):
+    files = data_files(path)
+    timings = {}
+    for workers in worker_counts:
+        effective = min(workers, len(files))
+        if effective in timings:
+            print(f"  {workers} workers: skipped, only {len(files)} file{'s' if len(files) > 1 else ''} to parse")
+            continue
+
+        _parsed_files.clear()
+        start = time.perf_counter()
+        load_data(path, workers)
+        timings[effective] = time.perf_counter() - start
+        print(f"  {effective} worker{'s' if effective > 1 else ''}: {timings[effective]:.2f}s "
+              f"({len(files)} files, {len(df):,} rows)")
+
+    return timings
+
+
+# Function to scan the whole frame for data-quality problems in one vectorized pass.
+# Returns one row per issue: location_name, year, check and detail. Gaps have no single
+# year; they carry their first and last missing year in gap_start and gap_end instead.
+def validate_data(frame, composition_tolerance=5.0):
+    issues = []
+
+    # detail is one text for every flagged row, or a function building the texts from the
+    # row mask, so per-row strings are only built for the rows that are flagged
+    def flag(mask, check, detail):
+        if mask.any():
+            flagged = frame.loc[mask, ['location_name', 'year']].copy()
+            flagged['check'] = check
+            flagged['detail'] = detail(mask) if callable(detail) else detail
+            issues.append(flagged)
+
+    # Gaps in the yearly series of each location
+    locations = frame['location_name'].values.astype(str)
+    years = frame['year'].values
+    order = np.lexsort((years, locations))
+    sorted_locations = locations[order]
+    sorted_years = years[order]
+    step = np.diff(sorted_years)
+    gap = (sorted_locations[1:] == sorted_locations[:-1]) & (step > 1)
+    if gap.any():
+        issues.append(pd.DataFrame({
+            'location_name': sorted_locations[1:][gap],
+            'year': np.nan,
+            'gap_start': sorted_years[:-1][gap] + 1,
+            'gap_end': sorted_years[1:][gap] - 1,
+            'check': 'year_gap',
+            'detail': [f'No data for {start + 1}-{end - 1}' if end - start > 2 else f'No data for {start + 1}'
+                       for start, end in zip(sorted_years[:-1][gap], sorted_years[1:][gap])]
+        }))
+
+    # Missing values in any of the measure columns
+    measure_columns = [
+        col for _, column, _ in FUNDING_SOURCES
+        for col in (column, column.replace('_mean', '_lower'), column.replace('_mean', '_upper'))
+        if col in frame.columns
+    ]
+    missing = frame[measure_columns].isna().values
+    names = np.array(measure_columns, dtype=object)
+    flag(missing.any(axis=1), 'missing_values',
+         lambda mask: ['Missing: ' + ', '.join(names[row]) for row in missing[mask]])
+
+    # Totals that make growth rates and shares meaningless
+    if 'the_total_mean' in frame.columns:
+        flag(frame['the_total_mean'].values <= 0, 'non_positive_total', 'Total health expenditure is zero or negative')
+
+    # Uncertainty bounds in the wrong order
+    for _, column, _ in FUNDING_SOURCES:
+        lower_col = column.replace('_mean', '_lower')
+        upper_col = column.replace('_mean', '_upper')
+        if {column, lower_col, upper_col} <= set(frame.columns):
+            mean = frame[column].values
+            flag((frame[lower_col].values > mean) | (mean > frame[upper_col].values),
+                 'bounds_order', f'{column}: mean is outside its lower/upper bounds')
+
+    # Funding sources that do not add up to the total
+    components = [col for col in FUNDING_COLUMNS if col in frame.columns]
+    if components and 'the_total_mean' in frame.columns:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = frame[components].values.sum(axis=1) / frame['the_total_mean'].values * 100
+        off = np.isfinite(share) & (np.abs(share - 100) > composition_tolerance)
+        flag(off, 'composition_sum',
+             lambda mask: [f'Funding sources sum to {value:.1f}% of the total' for value in share[mask]])
+
+    # Every report has the gap columns, even when no location has a gap
+    columns = ['location_name', 'year', 'gap_start', 'gap_end', 'check', 'detail']
+    if not issues:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(issues, ignore_index=True).reindex(columns=columns)
+
+
+# Function to get the data-quality report for the loaded data, computed once
+def get_validation_report():
+    if 'validation' not in _cache:
+        report = validate_data(df)
+        _cache['validation'] = report
+        _cache['validation_rows'] = report.groupby('location_name').indices
+
+    return _cache['validation']
+
+
+# Function to get the data-quality issues of one location within a year window
+def get_location_issues(selected_location, year_range=None):
+    report = get_validation_report()
+    rows = _cache['validation_rows'].get(selected_location)
+    if rows is None:
+        return report.iloc[:0]
+
+    return issues_in_window(report.iloc[rows], year_range)
+
+
+# Function to keep the issues of a year window: issues of a year inside it and gaps that
+# overlap it
+def issues_in_window(issues, year_range=None):
+    if year_range is None:
+        return issues
+
+    years = issues['year'].values.astype(float)
+    in_window = (years >= year_range[0]) & (years <= year_range[1])
+    overlaps = ((issues['gap_start'].values.astype(float) <= year_range[1]) &
+                (issues['gap_end'].values.astype(float) >= year_range[0]))
+    return issues[in_window | overlaps]
+
+
+# Function to format a growth rate for the stat cards; n/a when it cannot be computed
+def format_change(value):
+    if not np.isfinite(value):
+        return 'n/a'
+
+    return f"{'+' if value >= 0 else ''}{value:.1f}%"
+
+
+# Function to find the positions of a year window in a sorted array of years
+def year_slice(years, year_range=None):
+    if year_range is None:
+        return slice(0, len(years))
+
+    start = np.searchsorted(years, year_range[0], side='left')
+    stop = np.searchsorted(years, year_range[1], side='right')
+    return slice(start, stop)
+
+
+# Function to load the population, deflator and PPP tables once
+def load_reference_tables(population=POPULATION_FILE, deflator=DEFLATOR_FILE, ppp=PPP_FILE):
+    for name, path, column in [
+        ('population', population, 'population'),
+        ('deflator', deflator, 'deflator'),
+        ('ppp', ppp, 'ppp_factor')
+    ]:
+        if path is not None and os.path.exists(path):
+            reference_tables[name] = (pd.read_csv(path), column)
+
+    # Aligned arrays and normalized frames depend on the tables
+    for key in [key for key in _cache if isinstance(key, tuple) and key[0] in ('reference', 'normalized')]:
+        del _cache[key]
+
+    return reference_tables
+
+
+# Function to get the (location, year) grid the reference tables are aligned to
+def _location_year_codes():
+    if 'location_year_codes' not in _cache:
+        locations, location_codes = np.unique(df['location_name'].values.astype(str), return_inverse=True)
+        first_year = df['year'].min()
+        year_codes = (df['year'].values - first_year).astype(int)
+        _cache['location_year_codes'] = (locations, location_codes, first_year, year_codes)
+
+    return _cache['location_year_codes']
+
+
+# Function to align a reference table to a (location, year) array.
+# Tables without a location_name column apply the same value to every location.
+def _reference_array(name):
+    key = ('reference', name)
+    if key not in _cache:
+        table, column = reference_tables[name]
+        locations, _, first_year, year_codes = _location_year_codes()
+        values = np.full((len(locations), year_codes.max() + 1), np.nan)
+
+        table_years = table['year'].values - first_year
+        in_window = (table_years >= 0) & (table_years < values.shape[1])
+        if 'location_name' in table.columns:
+            table_locations = np.searchsorted(locations, table['location_name'].values.astype(str))
+            table_locations = np.minimum(table_locations, len(locations) - 1)
+            matched = in_window & (locations[table_locations] == table['location_name'].values.astype(str))
+            values[table_locations[matched], table_years[matched]] = table[column].values[matched]
+        else:
+            values[:, table_years[in_window]] = table[column].values[in_window]
+
+        _cache[key] = values
+
+    return _cache[key]
+
+
+# Function to get the data converted to one of NORMALIZATION_VARIANTS.
+# The conversion is a single multiply over all measure columns, and each variant is cached.
+def get_normalized_data(variant='nominal'):
+    factors = NORMALIZATION_VARIANTS[variant]['factors']
+    if not factors:
+        return df
+
+    key = ('normalized', variant)
+    if key not in _cache:
+        missing = [name for name in factors if name not in reference_tables]
+        if missing:
+            raise ValueError(f"Variant '{variant}' needs reference tables that are not loaded: {', '.join(missing)}")
+
+        _, location_codes, _, year_codes = _location_year_codes()
+        multiplier = np.ones(len(df))
+        for name in factors:
+            values = _reference_array(name)[location_codes, year_codes]
+            if name == 'ppp':
+                multiplier *= values
+            else:
+                multiplier /= values
+
+        measure_columns = [col for col in df.columns if col.endswith(('_mean', '_lower', '_upper'))]
+        normalized = df.copy()
+        normalized[measure_columns] = df[measure_columns].values * multiplier[:, None]
+        _cache[key] = normalized
+
+    return _cache[key]
+
+
+# Statistics stored for every measure in the data cube, in this order
+CUBE_STATS = ('mean', 'lower', 'upper')
+
+
+# Function to build the compact data model: one contiguous float32 array of shape
+# (location, year, measure x stat) in display units (the variant's scale is applied here,
+# once), NaN where a value is missing. The mean, lower and upper of a measure sit next to
+# each other, so per-trace series and hover bounds are views into the array.
+def build_cube(frame, scale=1):
+    measures = [column for _, column, _ in FUNDING_SOURCES if column in frame.columns]
+    locations, location_codes, first_year, year_codes = _location_year_codes()
+
+    values = np.full((len(locations), year_codes.max() + 1, len(measures) * len(CUBE_STATS)), np.nan,
+                     dtype=np.float32)
+    stat_columns = [
+        (i * len(CUBE_STATS) + j, column.replace('_mean', '_' + stat))
+        for i, column in enumerate(measures)
+        for j, stat in enumerate(CUBE_STATS)
+    ]
+    stat_columns = [(position, col) for position, col in stat_columns if col in frame.columns]
+    positions = [position for position, _ in stat_columns]
+    values[location_codes[:, None], year_codes[:, None], positions] = (
+        frame[[col for _, col in stat_columns]].values / scale)
+
+    # Years with a total health expenditure value for each location
+    present = ~np.isnan(values[:, :, measures.index('the_total_mean') * len(CUBE_STATS)])
+
+    return {
+        'values': values,
+        'locations': locations,
+        'location_index': {name: i for i, name in enumerate(locations)},
+        'years': first_year + np.arange(values.shape[1]),
+        'measures': measures,
+        'measure_index': {column: i for i, column in enumerate(measures)},
+        'has_bounds': {
+            column: {column.replace('_mean', '_lower'), column.replace('_mean', '_upper')} <= set(frame.columns)
+            for column in measures
+        },
+        'present': present
+    }
+
+
+# Function to get the data cube for a normalization variant, built once
+def get_cube(variant='nominal'):
+    key = ('cube', variant)
+    if key not in _cache:
+        _cache[key] = build_cube(get_normalized_data(variant), NORMALIZATION_VARIANTS[variant]['scale'])
+
+    return _cache[key]
+
+
+# Function to find the first and last year inside the window that has a total health
+# expenditure value, as indices into cube['years'], for one location or (by default) all of
+# them. has_data is False where the window holds no value at all.
+def window_bounds(cube, year_range=None, locations=slice(None)):
+    window = year_slice(cube['years'], year_range)
+    present = cube['present'][locations, window]
+    if present.shape[-1] == 0:
+        has_data = np.zeros(present.shape[:-1], dtype=bool)
+        return np.zeros_like(has_data, dtype=int), np.zeros_like(has_data, dtype=int), has_data
+
+    has_data = present.any(axis=-1)
+    first = window.start + present.argmax(axis=-1)
+    last = window.start + present.shape[-1] - 1 - present[..., ::-1].argmax(axis=-1)
+    return first, last, has_data
+
+
+# Function to get one statistic of one measure for one location as a view into the cube
+def cube_series(cube, location, measure, stat='mean', years=slice(None)):
+    position = cube['measure_index'][measure] * len(CUBE_STATS) + CUBE_STATS.index(stat)
+    return cube['values'][location, years, position]
+
+
+# Function to rank every location per year and measure in one pass, among all locations and
+# within its income group (from an income_group column, when the data has one).
+# Aggregates (every node that is another node's parent in the loaded hierarchy, whether
+# rolled up or shipped with its own estimates) are not ranked. Without a hierarchy,
+# aggregate rows such as Global cannot be told apart from countries and are ranked too.
+def build_rankings(cube, frame):
+    measures = cube['measures']
+    locations = cube['locations']
+    first_year = cube['years'][0]
+
+    values = cube['values'][:, :, 0::len(CUBE_STATS)].astype(float)
+    if 'hierarchy' in _cache:
+        hierarchy = _cache['hierarchy']
+        aggregates = hierarchy.loc[hierarchy['location_id'].isin(hierarchy['parent_id']), 'location_name']
+        values[np.isin(locations, aggregates.unique())] = np.nan
+    valid = ~np.isnan(values)
+
+    # Highest value first; NaNs sort last and get rank 0
+    order = np.argsort(-values, axis=0, kind='stable')
+    rank = np.empty(values.shape, dtype=np.int32)
+    np.put_along_axis(rank, order, np.arange(1, len(locations) + 1, dtype=np.int32)[:, None, None], axis=0)
+    rank[~valid] = 0
+    count = valid.sum(axis=0).astype(np.int32)
+
+    rankings = {
+        'location_index': {name: i for i, name in enumerate(locations)},
+        'first_year': first_year,
+        'measures': measures,
+        'rank': rank,
+        'count': count
+    }
+
+    if 'income_group' in frame.columns:
+        group_names = (
+            frame.dropna(subset=['income_group'])
+            .drop_duplicates('location_name')
+            .set_index('location_name')['income_group']
+            .reindex(locations)
+        )
+        groups, group_codes = np.unique(group_names.fillna('').values.astype(str), return_inverse=True)
+
+        # Sort by group, then by value within the group; the group blocks line up in every column
+        group_keys = np.broadcast_to(group_codes[:, None, None], values.shape)
+        group_order = np.lexsort((-values, group_keys), axis=0)
+        group_start = np.searchsorted(np.sort(group_codes), np.arange(len(groups)))
+        position = np.empty(values.shape, dtype=np.int32)
+        np.put_along_axis(position, group_order, np.arange(len(locations), dtype=np.int32)[:, None, None], axis=0)
+
+        group_rank = (position - group_start[group_codes][:, None, None] + 1).astype(np.int32)
+        group_rank[~valid] = 0
+        group_count = np.zeros((len(groups),) + values.shape[1:], dtype=np.int32)
+        np.add.at(group_count, group_codes, valid)
+
+        rankings.update({
+            'groups': groups,
+            'group_of': group_codes,
+            'group_rank': group_rank,
+            'group_count': group_count
+        })
+
+    return rankings
+
+
+# Function to get the rankings for a normalization variant, computed once
+def get_rankings(variant='nominal'):
+    key = ('rankings', variant)
+    if key not in _cache:
+        _cache[key] = build_rankings(get_cube(variant), get_normalized_data(variant))
+
+    return _cache[key]
+
+
+# Function to look up a location's rank and percentile for one year and measure
+def get_rank(selected_location, year, measure='the_total_mean', variant='nominal'):
+    rankings = get_rankings(variant)
+    location = rankings['location_index'].get(selected_location)
+    year_index = int(year - rankings['first_year'])
+    if location is None or measure not in rankings['measures'] or not 0 <= year_index < rankings['count'].shape[0]:
+        return None
+
+    measure_index = rankings['measures'].index(measure)
+    rank = int(rankings['rank'][location, year_index, measure_index])
+    if rank == 0:
         return None
 
-    # Calculate some statistics for the dashboard cards
-    latest_year = df_location['year'].max()
-    earliest_year = df_location['year'].min()
+    def percentile(rank, count):
+        return 100.0 if count <= 1 else 100.0 * (count - rank) / (count - 1)
+
+    count = int(rankings['count'][year_index, measure_index])
+    result = {'rank': rank, 'count': count, 'percentile': percentile(rank, count)}
+
+    if 'groups' in rankings:
+        group = rankings['group_of'][location]
+        group_count = int(rankings['group_count'][group, year_index, measure_index])
+        group_rank = int(rankings['group_rank'][location, year_index, measure_index])
+        if rankings['groups'][group]:
+            result.update({
+                'group': rankings['groups'][group],
+                'group_rank': group_rank,
+                'group_count': group_count,
+                'group_percentile': percentile(group_rank, group_count)
+            })
+
+    return result
+
+
+# Function to project every location and measure horizon years past the end of the year window.
+# All series get a log-linear trend from one batched least-squares solve; damping below 1 shrinks
+# the yearly growth by that factor each projected year (damped trend). The bands are 95%
+# prediction intervals built from the residuals of each fit. Values are in the cube's units.
+def build_forecasts(cube, year_range=None, horizon=5, damping=1.0):
+    measures = cube['measures']
+    locations = cube['locations']
+
+    window = year_slice(cube['years'], year_range)
+    years = cube['years'][window]
+    values = cube['values'][:, window, 0::len(CUBE_STATS)].astype(float)
+
+    # Fit log(value) = intercept + slope * t, with t = 0 at the last year of the window
+    last_year = years[-1]
+    t = (years - last_year).astype(float)[None, :, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_values = np.log(values)
+    weight = np.isfinite(log_values).astype(float)
+    log_values = np.where(weight > 0, log_values, 0.0)
+
+    s0 = weight.sum(axis=1)
+    s1 = (weight * t).sum(axis=1)
+    s2 = (weight * t ** 2).sum(axis=1)
+    sy = (weight * log_values).sum(axis=1)
+    sty = (weight * t * log_values).sum(axis=1)
+
+    # Normal equations for every (location, measure) pair, solved in one batched call
+    normal_matrix = np.stack([np.stack([s0, s1], axis=-1), np.stack([s1, s2], axis=-1)], axis=-2)
+    fitted = (s0 >= 3) & (s0 * s2 - s1 ** 2 > 0)
+    coefficients = np.full(s0.shape + (2,), np.nan)
+    coefficients[fitted] = np.linalg.solve(
+        normal_matrix[fitted],
+        np.stack([sy, sty], axis=-1)[fitted][..., None]
+    )[..., 0]
+    intercept = coefficients[..., 0]
+    slope = coefficients[..., 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residuals = weight * (log_values - (intercept[:, None] + slope[:, None] * t))
+        sigma = np.sqrt((residuals ** 2).sum(axis=1) / (s0 - 2))
+        t_mean = s1 / s0
+        t_spread = s2 - s1 ** 2 / s0
+
+    # Effective distance from the last year, shortened by damping
+    steps = np.cumsum(damping ** np.arange(1, horizon + 1))[None, :, None]
+    log_forecast = intercept[:, None] + slope[:, None] * steps
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = 1.96 * sigma[:, None] * np.sqrt(
+            1 + 1 / s0[:, None] + (steps - t_mean[:, None]) ** 2 / t_spread[:, None])
+
+    return {
+        'location_index': {name: i for i, name in enumerate(locations)},
+        'measures': measures,
+        'years': last_year + np.arange(1, horizon + 1),
+        'mean': np.exp(log_forecast).astype(np.float32),
+        'lower': np.exp(log_forecast - spread).astype(np.float32),
+        'upper': np.exp(log_forecast + spread).astype(np.float32)
+    }
+
+
+# Function to get the forecasts for a variant, year window and horizon, fitted once
+def get_forecasts(variant='nominal', year_range=None, horizon=5, damping=1.0):
+    key = ('forecasts', variant, None if year_range is None else tuple(year_range), horizon, damping)
+    if key not in _cache:
+        _cache[key] = build_forecasts(get_cube(variant), year_range, horizon, damping)
+
+    return _cache[key]
+
+
+# Function to format a rank for the stat cards, e.g. "#12 of 204 · 94th percentile"
+def format_rank(rank_info, group=False):
+    if rank_info is None or (group and 'group' not in rank_info):
+        return ''
+
+    prefix = 'group_' if group else ''
+    percentile = int(round(rank_info[prefix + 'percentile']))
+    suffix = 'th' if 10 <= percentile % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(percentile % 10, 'th')
+    text = f"#{rank_info[prefix + 'rank']} of {rank_info[prefix + 'count']} · {percentile}{suffix} percentile"
+
+    return f"{text} in {rank_info['group']}" if group else text
+
+
+# Function to load a location hierarchy and compute the depth of every node.
+# Roots have no parent_id (or are their own parent, as in IHME hierarchy files).
+def load_hierarchy(path=HIERARCHY_FILE):
+    hierarchy = pd.read_csv(path, usecols=['location_id', 'location_name', 'parent_id'])
+    ids = hierarchy['location_id'].values
+    parents = hierarchy['parent_id'].fillna(-1).astype(ids.dtype).values
+    parents = np.where(parents == ids, -1, parents)
+
+    # Walk every node up to its root at the same time
+    position_of = pd.Series(np.arange(len(ids)), index=ids)
+    parent_position = position_of.reindex(parents).fillna(-1).astype(int).values
+    level = np.zeros(len(ids), dtype=int)
+    current = parent_position.copy()
+    while (current >= 0).any():
+        level += current >= 0
+        current = np.where(current >= 0, parent_position[current], -1)
+
+    hierarchy['parent_id'] = parents
+    hierarchy['level'] = level
+    return hierarchy
+
+
+# Function to aggregate the *_total_mean/_lower/_upper measures bottom-up through the hierarchy.
+# Nodes that already have their own estimates keep them; every other node becomes the
+# sum of its children, for the years and measures all of its children with data report.
+# Returns only the new rollup rows.
+def build_rollups(frame, hierarchy):
+    measure_columns = [
+        col for col in frame.columns
+        if '_total_' in col and col.endswith(('_mean', '_lower', '_upper'))
+    ]
+    names = hierarchy.set_index('location_name')['location_id']
+    parent_of = hierarchy.set_index('location_id')['parent_id']
+    level_of = hierarchy.set_index('location_id')['level']
+
+    values = frame[['location_name', 'year'] + measure_columns].copy()
+    values['location_id'] = values['location_name'].map(names)
+    values = values.dropna(subset=['location_id'])
+    values['location_id'] = values['location_id'].astype(hierarchy['location_id'].dtype)
+    values = values.drop(columns='location_name')
+
+    has_data = set(values['location_id'])
+    rollups = []
+
+    # Deepest level first, so every parent sees its children's completed rollups
+    for level in range(hierarchy['level'].max(), 0, -1):
+        at_level = values[values['location_id'].map(level_of).values == level]
+        if at_level.empty:
+            continue
+
+        parents = at_level['location_id'].map(parent_of).values
+        grouped = at_level.assign(location_id=parents).groupby(['location_id', 'year'])[measure_columns]
+        sums = grouped.sum(min_count=1)
+
+        # Only sum a parent's year and measure when every child with data reports it; a
+        # partial sum would show up as an artificial dip in the regional series
+        expected = at_level.groupby(parents)['location_id'].nunique()
+        complete = grouped.count().values == expected.reindex(sums.index.get_level_values('location_id')).values[:, None]
+        sums = sums.where(complete).dropna(how='all').reset_index()
+        sums = sums[~sums['location_id'].isin(has_data)]
+        if sums.empty:
+            continue
+
+        has_data.update(sums['location_id'])
+        rollups.append(sums)
+        values = pd.concat([values, sums], ignore_index=True)
+
+    if not rollups:
+        return frame.iloc[:0]
 
-    latest_the = df_location[df_location['year'] == latest_year]['the_total_mean'].values[0]
-    earliest_the = df_location[df_location['year'] == earliest_year]['the_total_mean'].values[0]
+    rollups = pd.concat(rollups, ignore_index=True)
+    rollups.insert(0, 'location_name', rollups['location_id'].map(hierarchy.set_index('location_id')['location_name']))
+    if 'location_id' not in frame.columns:
+        rollups = rollups.drop(columns='location_id')
 
-    percent_change = ((latest_the - earliest_the) / earliest_the) * 100
+    return rollups
+
+
+# Function to add regional rollups to df once, so every node of the hierarchy has a dashboard
+def apply_hierarchy(hierarchy):
+    global df
+
+    if 'rollups' not in _cache:
+        rollups = build_rollups(df, hierarchy)
+        df = pd.concat([df, rollups], ignore_index=True).sort_values('year', kind='stable', ignore_index=True)
+        _cache.clear()
+        _cache['rollups'] = rollups
+        _cache['hierarchy'] = hierarchy
+
+    return _cache['rollups']
+
+
+# Function to normalize a location name for searching: case- and accent-insensitive,
+# with punctuation folded into single spaces ("Côte d'Ivoire" -> "cote d ivoire")
+def normalize_name(name):
+    decomposed = unicodedata.normalize('NFKD', str(name))
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', stripped.casefold()).split())
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Function to build the location search index: a prefix trie over the start of every word
+# in the normalized names, the normalized names in sorted order (names starting with a
+# prefix form one contiguous block there), plus a trigram index for fuzzy matching
+def build_search_index(names):
+    names = sorted(set(names))
+    normalized = [normalize_name(name) for name in names]
+
+    trie = {}
+    gram_postings = {}
+    gram_counts = np.zeros(len(names), dtype=np.int32)
+    exact = {}
+
+    for name_id, key in enumerate(normalized):
+        exact.setdefault(key, name_id)
+
+        # Every word start is a prefix entry point, so "ivo" finds "Côte d'Ivoire"
+        word_starts = [0] + [i + 1 for i, ch in enumerate(key) if ch == ' ']
+        for start in word_starts:
+            node = trie
+            for ch in key[start:]:
+                node = node.setdefault(ch, {})
+                ids = node.setdefault(None, [])
+                if not ids or ids[-1] != name_id:
+                    ids.append(name_id)
+
+        grams = _trigrams(key)
+        gram_counts[name_id] = len(grams)
+        for gram in grams:
+            gram_postings.setdefault(gram, []).append(name_id)
+
+    sorted_ids = sorted(range(len(names)), key=normalized.__getitem__)
+
+    return {
+        'names': names,
+        'normalized': normalized,
+        'sorted_keys': [normalized[i] for i in sorted_ids],
+        'sorted_ids': sorted_ids,
+        'exact': exact,
+        'trie': trie,
+        'grams': {gram: np.array(ids, dtype=np.int32) for gram, ids in gram_postings.items()},
+        'gram_counts': gram_counts
+    }
+
+
+# Function to get the search index for the loaded locations, built once
+def get_search_index():
+    if 'search_index' not in _cache:
+        _cache['search_index'] = build_search_index(df['location_name'].unique())
+
+    return _cache['search_index']
+
+
+# Function to search location names: exact match first, then names with a word starting
+# with the query, then fuzzy trigram matches for misspellings
+def search_locations(query, limit=10, min_similarity=0.3, index=None):
+    if index is None:
+        index = get_search_index()
+
+    key = normalize_name(query)
+    if not key:
+        return []
+
+    matches = []
+    if key in index['exact']:
+        matches.append(index['exact'][key])
+
+    # Names that start with the query: a binary search, then at most limit entries
+    sorted_keys = index['sorted_keys']
+    start = bisect_left(sorted_keys, key)
+    matches.extend(index['sorted_ids'][i] for i in range(start, min(start + limit, len(sorted_keys)))
+                   if sorted_keys[i].startswith(key))
+
+    # Then names with an inner word starting with the query, taken lazily up to limit
+    if len(matches) < limit:
+        node = index['trie']
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                break
+        if node is not None:
+            normalized = index['normalized']
+            matches.extend(islice((i for i in node[None] if not normalized[i].startswith(key)), limit))
+
+    # Fuzzy matches ranked by trigram similarity (Dice coefficient)
+    if len(set(matches)) < limit:
+        grams = _trigrams(key)
+        postings = [index['grams'][gram] for gram in grams if gram in index['grams']]
+        if postings:
+            shared = np.bincount(np.concatenate(postings), minlength=len(index['names']))
+            similarity = 2 * shared / (len(grams) + index['gram_counts'])
+            # Only names above the threshold are candidates, and only the top limit of them are
+            # sorted; ties at the cut-off go to the earliest names, as a stable sort would pick them
+            candidates = np.flatnonzero(similarity >= min_similarity)
+            if len(candidates) > limit:
+                values = similarity[candidates]
+                cutoff = -np.partition(-values, limit - 1)[limit - 1]
+                above = candidates[values > cutoff]
+                candidates = np.concatenate([above, candidates[values == cutoff][:limit - len(above)]])
+            candidates = candidates[np.lexsort((candidates, -similarity[candidates]))]
+            matches.extend(int(i) for i in candidates)
+
+    results = []
+    for name_id in matches:
+        name = index['names'][name_id]
+        if name not in results:
+            results.append(name)
+            if len(results) == limit:
+                break
+
+    return results
+
+
+# Function to turn what the user typed into a location name, asking them to pick
+# from the closest matches when the input is not exact
+def resolve_location(query):
+    index = get_search_index()
+    key = normalize_name(query)
+    if key in index['exact']:
+        return index['names'][index['exact'][key]]
+
+    matches = search_locations(query)
+    if len(matches) == 1:
+        return matches[0]
+    if not matches:
+        return query
+
+    print("Did you mean:")
+    for i, name in enumerate(matches):
+        print(f"  {i + 1}. {name}")
+    choice = input("\nPlease select a location from the list above: ")
+    if choice.isdigit() and 1 <= int(choice) <= len(matches):
+        return matches[int(choice) - 1]
+
+    return resolve_location(choice) if choice.strip() else query
+
+
+# Function to autocomplete location names on Tab in the interactive prompt
+def _complete_location(text, state):
+    matches = search_locations(text, limit=20)
+    return matches[state] if state < len(matches) else None
+
+
+# Function to convert an IHME draw-level CSV into a memory-mapped store.
+# The CSV has one row per location_name, year and measure (e.g. 'the_total') followed by
+# draw_0 ... draw_999 columns. Draws are copied chunk by chunk into a float32 .npy file,
+# so the whole extract never has to fit in memory.
+def build_draw_store(csv_path, store_dir=DRAW_STORE_DIR, chunksize=10000):
+    key_columns = ['location_name', 'year', 'measure']
+    header = pd.read_csv(csv_path, nrows=0).columns
+    draw_columns = [col for col in header if col.startswith('draw_')]
+
+    index = pd.read_csv(csv_path, usecols=key_columns)
+
+    os.makedirs(store_dir, exist_ok=True)
+    draws = np.lib.format.open_memmap(
+        os.path.join(store_dir, 'draws.npy'),
+        mode='w+',
+        dtype=np.float32,
+        shape=(len(index), len(draw_columns))
+    )
+
+    row = 0
+    for chunk in pd.read_csv(csv_path, usecols=draw_columns, dtype=np.float32, chunksize=chunksize):
+        draws[row:row + len(chunk)] = chunk[draw_columns].values
+        row += len(chunk)
+    draws.flush()
+    del draws
+
+    index.to_csv(os.path.join(store_dir, 'index.csv'), index=False)
+
+    return load_draw_store(store_dir)
+
+
+# Function to open a draw store without reading the draws into memory
+def load_draw_store(store_dir=DRAW_STORE_DIR):
+    index = pd.read_csv(os.path.join(store_dir, 'index.csv'))
+    draws = np.load(os.path.join(store_dir, 'draws.npy'), mmap_mode='r')
+
+    return {
+        'index': index,
+        'draws': draws,
+        'rows': index.groupby('location_name').indices
+    }
+
+
+# Function to reduce the draws of one location to per-year distributions.
+# Returns (years, stats): the box statistics per year and the number of draws in 'count',
+# with one row per measure.
+# The whiskers span the 95% uncertainty interval (2.5th to 97.5th percentile of the draws).
+def summarize_draws(draw_store, selected_location, measures, batch_size=256):
+    rows = draw_store['rows'].get(selected_location)
+    if rows is None:
+        return None
+
+    index = draw_store['index'].iloc[rows]
+    years = np.sort(index['year'].unique())
+
+    measure_index = index['measure'].map({measure: i for i, measure in enumerate(measures)}).values
+    year_index = np.searchsorted(years, index['year'].values)
+
+    stat_names = ['lowerfence', 'q1', 'median', 'q3', 'upperfence', 'mean', 'count']
+    stats = {name: np.full((len(measures), len(years)), np.nan) for name in stat_names}
+
+    # Only batch_size rows of draws are pulled from the memory map at a time
+    for start in range(0, len(rows), batch_size):
+        batch_slice = slice(start, start + batch_size)
+        keep = ~np.isnan(measure_index[batch_slice])
+        if not keep.any():
+            continue
+
+        batch = np.asarray(draw_store['draws'][rows[batch_slice][keep]], dtype=float) / 1000000
+        target = (
+            measure_index[batch_slice][keep].astype(int),
+            year_index[batch_slice][keep]
+        )
+
+        with np.errstate(invalid='ignore'):
+            quantiles = np.nanquantile(batch, [0.025, 0.25, 0.5, 0.75, 0.975], axis=1)
+            for name, values in zip(stat_names[:5], quantiles):
+                stats[name][target] = values
+            stats['mean'][target] = np.nanmean(batch, axis=1)
+        stats['count'][target] = (~np.isnan(batch)).sum(axis=1)
+
+    stats['count'] = np.nan_to_num(stats['count']).astype(int)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['notchspan'] = 1.57 * (stats['q3'] - stats['q1']) / np.sqrt(stats['count'])
+
+    return years, stats
+
+
+# Function to gather everything a dashboard shows as plain data: the stat-card values, the
+# funding composition, ranks, data-quality notes and the per-source series. All values are in
+# display units (see NORMALIZATION_VARIANTS) and the series are views into the data cube.
+# year_range is an inclusive (first, last) window (None for all years) and measures a list
+# of *_mean columns from FUNDING_SOURCES (None for all of them). variant picks one of
+# NORMALIZATION_VARIANTS. forecast_years adds projected trends with uncertainty bands
+# (damping < 1 for a damped trend).
+def build_dashboard_data(selected_location, year_range=DEFAULT_YEAR_RANGE, measures=None, variant='nominal',
+                         forecast_years=0, damping=1.0):
+    # Find the selected location and year window in the data cube
+    cube = get_cube(variant)
+    scale = NORMALIZATION_VARIANTS[variant]['scale']
+    unit = NORMALIZATION_VARIANTS[variant]['unit']
+
+    location = cube['location_index'].get(selected_location)
+    if location is None:
+        return None
+
+    first, last, has_data = window_bounds(cube, year_range, location)
+    if not has_data:
+        return None
+    years = slice(first, last + 1)
+
+    # Calculate some statistics for the dashboard cards (values are in display units)
+    latest_year = cube['years'][last]
+    earliest_year = cube['years'][first]
+
+    the_series = cube_series(cube, location, 'the_total_mean', years=years)
+    latest_the = float(the_series[-1])
+    earliest_the = float(the_series[0])
+
+    # Growth is undefined when the first total is zero, negative or missing
+    valid_base = earliest_the > 0 and np.isfinite(latest_the)
+    percent_change = ((latest_the - earliest_the) / earliest_the) * 100 if valid_base else np.nan
 
     # Calculate average annual growth
     years_span = latest_year - earliest_year
-    avg_annual_growth = (((latest_the / earliest_the) ** (1 / years_span)) - 1) * 100
-
-    # Convert values to millions for display
-    latest_the_millions = latest_the / 1000000
-    earliest_the_millions = earliest_the / 1000000
+    if valid_base and latest_the >= 0 and years_span > 0:
+        avg_annual_growth = (((latest_the / earliest_the) ** (1 / years_span)) - 1) * 100
+    else:
+        avg_annual_growth = np.nan
 
     # Get the funding source composition for the latest year
-    funding_columns = ['ghes_total_mean', 'ppp_total_mean', 'oop_total_mean', 'dah_total_mean']
-    latest_data = df_location[df_location['year'] == latest_year]
+    if measures is None:
+        measures = [column for _, column, _ in FUNDING_SOURCES]
+    funding_columns = [col for col in FUNDING_COLUMNS if col in measures and col in cube['measure_index']]
 
     funding_composition = {}
     for col in funding_columns:
-        if col in latest_data.columns:
-            value = latest_data[col].values[0]
-            if not np.isnan(value):
-                funding_composition[col] = value
+        value = cube_series(cube, location, col, years=last)
+        if not np.isnan(value):
+            funding_composition[col] = float(value)
 
     # Calculate percentages
-    total_specified = sum(funding_composition.values())
-    funding_percentages = {k: (v / latest_the) * 100 for k, v in funding_composition.items()}
-
-    # Define funding sources with their labels and columns
-    funding_sources = [
-        ('Total Health Expenditure', 'the_total_mean', '#3B82F6'),  # Modern blue
-        ('Government Health Expenditure', 'ghes_total_mean', '#EF4444'),  # Modern red
-        ('Prepaid Private Plans', 'ppp_total_mean', '#10B981'),  # Modern green
-        ('Out-of-Pocket Spending', 'oop_total_mean', '#F59E0B'),  # Modern amber
-        ('Development Assistance for Health', 'dah_total_mean', '#8B5CF6')  # Modern purple
-    ]
+    funding_percentages = {k: (v / latest_the) * 100 for k, v in funding_composition.items()} if latest_the > 0 else {}
 
-    # Create a figure with subplots
-    fig = make_subplots(rows=1, cols=1)
+    # Funding sources with their labels and colors, in the order requested
+    known_sources = {column: (source_name, column, color) for source_name, column, color in FUNDING_SOURCES}
+    funding_sources = [known_sources[column] for column in measures if column in known_sources]
 
-    # Add traces for each funding source
+    # Per-source series as views into the cube; lower and upper sit side by side as 'bounds'
+    series = []
     for source_name, column, color in funding_sources:
-        # Check if the column exists
-        if column not in df_location.columns:
+        if column not in cube['measure_index']:
             continue
 
-        # Get corresponding lower and upper bound columns
-        lower_col = column.replace('_mean', '_lower')
-        upper_col = column.replace('_mean', '_upper')
+        has_bounds = cube['has_bounds'][column]
+        bounds_start = cube['measure_index'][column] * len(CUBE_STATS) + CUBE_STATS.index('lower')
+        series.append({
+            'name': source_name,
+            'column': column,
+            'color': color,
+            'year': cube['years'][years],
+            'mean': cube_series(cube, location, column, 'mean', years),
+            'lower': cube_series(cube, location, column, 'lower', years) if has_bounds else None,
+            'upper': cube_series(cube, location, column, 'upper', years) if has_bounds else None,
+            'bounds': cube['values'][location, years, bounds_start:bounds_start + 2] if has_bounds else None
+        })
+
+    # Projected trends after the last observed year
+    forecast = []
+    if forecast_years:
+        forecasts = get_forecasts(variant, year_range, forecast_years, damping)
+
+        for source_name, column, color in funding_sources:
+            if column not in forecasts['measures']:
+                continue
+
+            measure_index = forecasts['measures'].index(column)
+            mean = forecasts['mean'][location, :, measure_index]
+            if np.isnan(mean).all():
+                continue
+
+            forecast.append({
+                'name': source_name,
+                'column': column,
+                'color': color,
+                'year': forecasts['years'],
+                'mean': mean,
+                'lower': forecasts['lower'][location, :, measure_index],
+                'upper': forecasts['upper'][location, :, measure_index]
+            })
+
+    return {
+        'location': selected_location,
+        'variant': variant,
+        'year_range': year_range,
+        'scale': scale,
+        'unit': unit,
+        'earliest_year': earliest_year,
+        'latest_year': latest_year,
+        'years_span': years_span,
+        'earliest_the': earliest_the,
+        'latest_the': latest_the,
+        'percent_change': percent_change,
+        'avg_annual_growth': avg_annual_growth,
+        # Rank among all locations (and the income group) for the latest year
+        'the_rank': get_rank(selected_location, latest_year, 'the_total_mean', variant),
+        'composition': funding_percentages,
+        'composition_ranks': {
+            col: get_rank(selected_location, latest_year, col, variant) for col in funding_percentages
+        },
+        # Data-quality issues found at load time for this location and window
+        'issues': get_location_issues(selected_location, year_range),
+        'series': series,
+        'forecast': forecast
+    }
+
+
+# Function to build the Plotly figure for the data from build_dashboard_data.
+# When a draw_store is given, the boxes show the distribution of the draws instead
+# (nominal variant only). Their statistics are computed server-side and shipped through
+# Plotly's q1/median/q3 fields; measures the draw store lacks keep the regular trace.
+def build_figure(data, draw_store=None):
+    unit = data['unit']
+    year_range = data['year_range']
+
+    # Create a figure with subplots
+    fig = make_subplots(rows=1, cols=1)
 
-        # Create customdata for hover information
-        years = df_location['year'].values
-
-        # Convert the main values to millions for display
-        y_values_millions = df_location[column].values / 1000000
-
-        if lower_col in df_location.columns and upper_col in df_location.columns:
-            # Add customdata for hover information
-            customdata = np.column_stack((
-                df_location[lower_col].values / 1000000,  # Lower bound in millions
-                df_location[upper_col].values / 1000000,  # Upper bound in millions
-                years  # Year
-            ))
-
-            # Simple hover template with white text - FIXED TOOLTIP VALUES
-            hovertemplate = (
-                    '<span style="color: white; font-weight: bold; font-family: Inter, sans-serif;">' +
-                    'Year: %{customdata[2]}<br>' +
-                    f'{source_name}<br>' +
-                    'Value: $%{customdata[0]:.1f}M - $%{customdata[1]:.1f}M<br>' +
-                    'Mean: $%{y:.1f}M<br>' +
-                    '</span>' +
-                    '<extra></extra>'
+    # Summarize the draws of every funding source in one pass; shipping 1,000 points per
+    # box is not an option
+    box_columns = [source['column'] for source in data['series']]
+    draw_summary = None
+    if draw_store is not None and data['variant'] == 'nominal':
+        draw_summary = summarize_draws(
+            draw_store,
+            data['location'],
+            [column.replace('_mean', '') for column in box_columns]
+        )
+    if draw_summary is not None:
+        box_years, box_stats = draw_summary
+
+    # Add traces for each funding source
+    for source in data['series']:
+        source_name = source['name']
+        column = source['column']
+        color = source['color']
+
+        source_index = box_columns.index(column)
+        if draw_summary is not None and box_stats['count'][source_index].max() > 0:
+            has_data = box_stats['count'][source_index] > 0
+            if year_range is not None:
+                has_data &= (box_years >= year_range[0]) & (box_years <= year_range[1])
+
+            trace_data = dict(
+                x=box_years[has_data],
+                q1=box_stats['q1'][source_index][has_data],
+                median=box_stats['median'][source_index][has_data],
+                q3=box_stats['q3'][source_index][has_data],
+                lowerfence=box_stats['lowerfence'][source_index][has_data],
+                upperfence=box_stats['upperfence'][source_index][has_data],
+                mean=box_stats['mean'][source_index][has_data],
+                notchspan=box_stats['notchspan'][source_index][has_data],
+                boxpoints=False,
+                hovertemplate=(
+                        '<span style="color: white; font-weight: bold; font-family: Inter, sans-serif;">' +
+                        'Year: %{x}<br>' +
+                        f'{source_name}<br>' +
+                        f'Value: $%{{y:.1f}}{unit}<br>' +
+                        '</span>' +
+                        '<extra></extra>'
+                )
             )
         else:
-            customdata = np.column_stack((years,))
-
-            hovertemplate = (
-                    '<span style="color: white; font-weight: bold; font-family: Inter, sans-serif;">' +
-                    'Year: %{customdata[0]}<br>' +
-                    f'{source_name}<br>' +
-                    'Value: $%{y:.1f}M<br>' +
-                    '</span>' +
-                    '<extra></extra>'
+            # Create customdata for hover information
+            years = source['year']
+
+            if source['bounds'] is not None:
+                # Lower and upper bounds in display units, straight from the cube
+                customdata = source['bounds']
+
+                # Simple hover template with white text - FIXED TOOLTIP VALUES
+                hovertemplate = (
+                        '<span style="color: white; font-weight: bold; font-family: Inter, sans-serif;">' +
+                        'Year: %{x}<br>' +
+                        f'{source_name}<br>' +
+                        f'Value: $%{{customdata[0]:.1f}}{unit} - $%{{customdata[1]:.1f}}{unit}<br>' +
+                        f'Mean: $%{{y:.1f}}{unit}<br>' +
+                        '</span>' +
+                        '<extra></extra>'
+                )
+            else:
+                customdata = None
+
+                hovertemplate = (
+                        '<span style="color: white; font-weight: bold; font-family: Inter, sans-serif;">' +
+                        'Year: %{x}<br>' +
+                        f'{source_name}<br>' +
+                        f'Value: $%{{y:.1f}}{unit}<br>' +
+                        '</span>' +
+                        '<extra></extra>'
+                )
+
+            trace_data = dict(
+                y=source['mean'],  # Use values in display units
+                x=years,
+                hovertemplate=hovertemplate,
+                customdata=customdata,
+                boxpoints='all',  # Show all points
+                quartilemethod="linear"  # Ensure consistent quartile calculation
             )
 
         # Add boxplot trace with enhanced styling for better box visibility
         fig.add_trace(
             go.Box(
-                y=y_values_millions,  # Use values in millions
-                x=df_location['year'],
                 name=source_name,
                 marker=dict(
                     color=color,
@@ -132,19 +1263,61 @@ def generate_dashboard(selected_location):
                     width=4  # Significantly increased line width for better visibility
                 ),
                 fillcolor=color.replace('rgb', 'rgba').replace(')', ', 0.2)'),  # Increased fill opacity
-                hovertemplate=hovertemplate,
-                customdata=customdata,
-                boxpoints='all',  # Show all points
                 jitter=0.2,  # Reduced jitter to keep points closer to the box
                 pointpos=0,  # Position of points relative to box
                 boxmean=True,  # Show the mean
                 whiskerwidth=1.0,  # Maximum valid whisker width (must be between 0 and 1)
                 notched=True,  # Add notches to boxplot
                 notchwidth=0.5,
-                quartilemethod="linear"  # Ensure consistent quartile calculation
+                **trace_data
             )
         )
 
+    # Add projected trends after the last observed year
+    forecast_x = []
+    for source in data['forecast']:
+        source_name = source['name']
+        color = source['color']
+        forecast_x = list(source['year'])
+        band_color = f'rgba({int(color[1:3], 16)}, {int(color[3:5], 16)}, {int(color[5:7], 16)}, 0.15)'
+
+        # Uncertainty band as one closed shape, upper edge then lower edge reversed
+        fig.add_trace(
+            go.Scatter(
+                x=forecast_x + forecast_x[::-1],
+                y=np.concatenate([source['upper'], source['lower'][::-1]]),
+                fill='toself',
+                fillcolor=band_color,
+                line=dict(width=0),
+                legendgroup=source_name,
+                showlegend=False,
+                hoverinfo='skip'
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=forecast_x,
+                y=source['mean'],
+                customdata=np.column_stack((source['lower'], source['upper'])),
+                mode='lines+markers',
+                name=f'{source_name} (projected)',
+                legendgroup=source_name,
+                line=dict(color=color, width=3, dash='dash'),
+                marker=dict(color=color, size=8),
+                hovertemplate=(
+                        '<span style="color: white; font-weight: bold; font-family: Inter, sans-serif;">' +
+                        'Year: %{x} (projected)<br>' +
+                        f'{source_name}<br>' +
+                        f'Range: $%{{customdata[0]:.1f}}{unit} - $%{{customdata[1]:.1f}}{unit}<br>' +
+                        f'Projection: $%{{y:.1f}}{unit}<br>' +
+                        '</span>' +
+                        '<extra></extra>'
+                )
+            )
+        )
+
+    observed_years = sorted(set(data['series'][0]['year'])) if data['series'] else []
+
     # Update layout with enhanced styling for better box visibility
     fig.update_layout(
         template='plotly_white',
@@ -182,7 +1355,7 @@ def generate_dashboard(selected_location):
     fig.update_xaxes(
         tickangle=45,
         tickmode='array',
-        tickvals=sorted(df_location['year'].unique()),
+        tickvals=observed_years + forecast_x,
         title=dict(
             text='Year',
             font=dict(
@@ -207,9 +1380,9 @@ def generate_dashboard(selected_location):
     # Format y-axis for currency with modern styling
     fig.update_yaxes(
         tickprefix='$',
-        ticksuffix='M',  # Add 'M' suffix to indicate millions
+        ticksuffix=unit,  # Add 'M' suffix to indicate millions
         title=dict(
-            text='Spending (Millions USD)',  # Updated label to clarify millions
+            text=NORMALIZATION_VARIANTS[data['variant']]['axis_title'],  # Label clarifies the unit
             font=dict(
                 family="Inter, sans-serif",
                 size=14,
@@ -230,8 +1403,321 @@ def generate_dashboard(selected_location):
         zeroline=False
     )
 
-    # Convert the plot to JSON for embedding
-    plot_json = fig.to_json()
+    return fig
+
+
+# Function to get the dashboard data as JSON: stat cards, composition and per-trace series.
+# Nothing is rendered, so the Plotly and HTML stages are skipped entirely.
+def dashboard_json(selected_location, **options):
+    data = build_dashboard_data(selected_location, **options)
+    if data is None:
+        return None
+
+    # 'bounds' repeats lower and upper side by side for the hover labels
+    for source in data['series']:
+        del source['bounds']
+
+    return json.dumps(_json_ready(data))
+
+
+def _json_ready(value):
+    if isinstance(value, dict):
+        return {str(k): _json_ready(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_ready(v) for v in value]
+    if isinstance(value, pd.DataFrame):
+        return _json_ready(value.to_dict(orient='records'))
+    if isinstance(value, np.ndarray):
+        return _json_ready(value.tolist())
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+
+# Function to collect the dashboard data of many locations as flat tables:
+# one summary row per location, one row per composition share and one row per series point
+def dashboard_tables(locations=None, **options):
+    if locations is None:
+        locations = get_search_index()['names']
+
+    summary, composition, series = [], [], []
+    for location in locations:
+        data = build_dashboard_data(location, **options)
+        if data is None:
+            continue
+
+        rank = data['the_rank'] or {}
+        summary.append({
+            'location_name': location,
+            'earliest_year': int(data['earliest_year']),
+            'latest_year': int(data['latest_year']),
+            'latest_the': data['latest_the'],
+            'percent_change': data['percent_change'],
+            'avg_annual_growth': data['avg_annual_growth'],
+            'the_rank': rank.get('rank'),
+            'the_percentile': rank.get('percentile'),
+            'issue_count': len(data['issues'])
+        })
+        composition.extend(
+            {'location_name': location, 'measure': column, 'percent': percent}
+            for column, percent in data['composition'].items()
+        )
+        for kind, traces in (('observed', data['series']), ('projected', data['forecast'])):
+            for source in traces:
+                n = len(source['year'])
+                series.append(pd.DataFrame({
+                    'location_name': location,
+                    'measure': source['column'],
+                    'kind': kind,
+                    'year': source['year'],
+                    'mean': source['mean'],
+                    'lower': source['lower'] if source['lower'] is not None else np.full(n, np.nan),
+                    'upper': source['upper'] if source['upper'] is not None else np.full(n, np.nan)
+                }))
+
+    return {
+        'summary': pd.DataFrame(summary),
+        'composition': pd.DataFrame(composition, columns=['location_name', 'measure', 'percent']),
+        'series': pd.concat(series, ignore_index=True) if series else pd.DataFrame()
+    }
+
+
+# Function to write the dashboard tables of many locations as Arrow IPC files
+# (summary.arrow, composition.arrow, series.arrow) in output_dir. Requires pyarrow.
+def export_dashboard_arrow(output_dir, locations=None, **options):
+    if pa is None:
+        raise ImportError("Arrow output requires pyarrow (pip install pyarrow)")
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, table in dashboard_tables(locations, **options).items():
+        arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+        path = os.path.join(output_dir, f'{name}.arrow')
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+        paths.append(path)
+
+    return paths
+
+
+# Function to fingerprint the page template: this file's source plus the Plotly version,
+# so any change to the styling or rendering code invalidates cached figures
+def template_fingerprint():
+    global _template_fingerprint
+
+    if _template_fingerprint is None:
+        with open(os.path.abspath(__file__), 'rb') as f:
+            digest = hashlib.sha256(f.read())
+        digest.update(plotly.__version__.encode())
+        _template_fingerprint = digest.hexdigest()
+
+    return _template_fingerprint
+
+
+# Function to compute the figure cache key of a dashboard: a hash of the location's data slice,
+# its stat-card values and the template fingerprint
+def figure_cache_key(data):
+    digest = hashlib.sha256(template_fingerprint().encode())
+    digest.update(repr((
+        data['location'], data['variant'], data['unit'], data['year_range'],
+        data['earliest_year'], data['latest_year'], data['latest_the'],
+        data['percent_change'], data['avg_annual_growth'], data['the_rank']
+    )).encode())
+
+    for source in data['series'] + data['forecast']:
+        digest.update(repr((source['name'], source['column'], source['color'])).encode())
+        for key in ('year', 'mean', 'lower', 'upper'):
+            if source[key] is not None:
+                digest.update(np.ascontiguousarray(source[key]).tobytes())
+
+    return digest.hexdigest()
+
+
+def _figure_cache(cache_dir):
+    if cache_dir not in _figure_cache_connections:
+        os.makedirs(cache_dir, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(cache_dir, 'figures.sqlite'))
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS figures ('
+                'key TEXT PRIMARY KEY, plot_json TEXT NOT NULL, stat_cards TEXT NOT NULL, '
+                'size INTEGER NOT NULL, last_used REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS figures_last_used ON figures (last_used)')
+        _figure_cache_connections[cache_dir] = connection
+
+    return _figure_cache_connections[cache_dir]
+
+
+# Function to get a cached (plot_json, stat_cards) pair, or None
+def figure_cache_get(cache_dir, key):
+    connection = _figure_cache(cache_dir)
+    row = connection.execute('SELECT plot_json, stat_cards FROM figures WHERE key = ?', (key,)).fetchone()
+    if row is not None:
+        with connection:
+            connection.execute('UPDATE figures SET last_used = ? WHERE key = ?', (time.time(), key))
+
+    return row
+
+
+# Function to store a rendered figure and stat cards, evicting the least recently used
+# entries once the cache grows past max_bytes
+def figure_cache_put(cache_dir, key, plot_json, stat_cards, max_bytes=FIGURE_CACHE_MAX_BYTES):
+    connection = _figure_cache(cache_dir)
+    size = len(plot_json.encode('utf-8')) + len(stat_cards.encode('utf-8'))
+
+    with connection:
+        connection.execute(
+            'INSERT OR REPLACE INTO figures (key, plot_json, stat_cards, size, last_used) VALUES (?, ?, ?, ?, ?)',
+            (key, plot_json, stat_cards, size, time.time())
+        )
+
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM figures').fetchone()[0]
+        if total > max_bytes:
+            evicted = []
+            for old_key, old_size in connection.execute('SELECT key, size FROM figures ORDER BY last_used'):
+                if total <= max_bytes:
+                    break
+                evicted.append((old_key,))
+                total -= old_size
+            connection.executemany('DELETE FROM figures WHERE key = ?', evicted)
+
+
+# Function to generate HTML with custom dashboard; see build_dashboard_data and build_figure
+# for the options. The figure JSON and stat cards are reused from the on-disk cache in
+# cache_dir when the same data was rendered before (None disables the cache; dashboards
+# with draw-level data are not cached).
+def generate_dashboard(selected_location, year_range=DEFAULT_YEAR_RANGE, measures=None,
+                       draw_store=None, variant='nominal',
+                       forecast_years=0, damping=1.0, cache_dir=FIGURE_CACHE_DIR):
+    data = build_dashboard_data(selected_location, year_range, measures, variant, forecast_years, damping)
+
+    if data is None:
+        print(f"No data found for '{selected_location}'. Please check the spelling or choose another location.")
+        return None
+
+    cache_key = None
+    cached = None
+    if cache_dir is not None and draw_store is None:
+        cache_key = figure_cache_key(data)
+        cached = figure_cache_get(cache_dir, cache_key)
+
+    # Values used in the page
+    unit = data['unit']
+    earliest_year = data['earliest_year']
+    latest_year = data['latest_year']
+    years_span = data['years_span']
+    latest_the_scaled = data['latest_the']
+    percent_change = data['percent_change']
+    avg_annual_growth = data['avg_annual_growth']
+    the_rank = data['the_rank']
+    funding_percentages = data['composition']
+    funding_ranks = data['composition_ranks']
+    funding_sources = [(source['name'], source['column'], source['color']) for source in data['series']]
+    location_issues = data['issues']
+
+    if cached is not None:
+        plot_json, stat_cards_html = cached
+    else:
+        fig = build_figure(data, draw_store)
+
+        # Convert the plot to JSON for embedding
+        plot_json = fig.to_json()
+
+        # Key statistics cards
+        stat_cards_html = f'''<div class="row">
+                <div class="col-md-3 mb-4">
+                    <div class="stat-card card-hover-effect">
+                        <div class="stat-card-title">
+                            <div class="icon-circle">
+                                <i class="fas fa-chart-line"></i>
+                            </div>
+                            Total Health Expenditure
+                        </div>
+                        <div class="stat-card-value">${latest_the_scaled:,.1f}{unit}</div>
+                        <div class="stat-card-subtitle">Recorded in {latest_year}</div>
+                        <div class="stat-card-rank">{format_rank(the_rank)}</div>
+                        <div class="stat-card-rank">{format_rank(the_rank, group=True)}</div>
+                    </div>
+                </div>
+
+                <div class="col-md-3 mb-4">
+                    <div class="stat-card card-hover-effect">
+                        <div class="stat-card-title">
+                            <div class="icon-circle">
+                                <i class="fas fa-percentage"></i>
+                            </div>
+                            Overall Growth
+                        </div>
+                        <div class="stat-card-value {'trend-positive' if percent_change >= 0 else 'trend-negative' if percent_change < 0 else ''}">
+                            {format_change(percent_change)}
+                        </div>
+                        <div class="stat-card-subtitle">Since {earliest_year}</div>
+                    </div>
+                </div>
+
+                <div class="col-md-3 mb-4">
+                    <div class="stat-card card-hover-effect">
+                        <div class="stat-card-title">
+                            <div class="icon-circle">
+                                <i class="fas fa-calendar-day"></i>
+                            </div>
+                            Annual Growth Rate
+                        </div>
+                        <div class="stat-card-value {'trend-positive' if avg_annual_growth >= 0 else 'trend-negative' if avg_annual_growth < 0 else ''}">
+                            {format_change(avg_annual_growth)}
+                        </div>
+                        <div class="stat-card-subtitle">Average per year</div>
+                    </div>
+                </div>
+
+                <div class="col-md-3 mb-4">
+                    <div class="stat-card card-hover-effect">
+                        <div class="stat-card-title">
+                            <div class="icon-circle">
+                                <i class="fas fa-clock"></i>
+                            </div>
+                            Study Period
+                        </div>
+                        <div class="stat-card-value">{years_span} years</div>
+                        <div class="stat-card-subtitle">{earliest_year} to {latest_year}</div>
+                    </div>
+                </div>
+            </div>'''
+
+        if cache_key is not None:
+            figure_cache_put(cache_dir, cache_key, plot_json, stat_cards_html)
+
+    # Note any data-quality issues for this location above the composition card
+    data_quality_html = ''
+    if not location_issues.empty:
+        issue_items = ''.join([
+            f'<li>{"" if np.isnan(year) else f"{int(year)}: "}{detail}</li>'
+            for year, detail in zip(location_issues['year'].values[:10], location_issues['detail'].values[:10])
+        ])
+        more_issues = (
+            f'<div class="stat-card-subtitle">and {len(location_issues) - 10} more</div>'
+            if len(location_issues) > 10 else ''
+        )
+        data_quality_html = f'''
+            <div class="row">
+                <div class="col-12 mb-4">
+                    <div class="stat-card data-quality-card">
+                        <div class="stat-card-title">
+                            <div class="icon-circle">
+                                <i class="fas fa-exclamation-triangle"></i>
+                            </div>
+                            Data Quality Notes
+                        </div>
+                        <ul class="data-quality-list mb-0">{issue_items}</ul>
+                        {more_issues}
+                    </div>
+                </div>
+            </div>
+        '''
 
     # Generate HTML with custom dashboard
     html_content = f'''
@@ -409,6 +1895,27 @@ def generate_dashboard(selected_location):
                 margin-top: auto;
             }}
 
+            .stat-card-rank {{
+                font-size: 0.8rem;
+                font-weight: 600;
+                color: var(--primary-color);
+            }}
+
+            .data-quality-card {{
+                border-left: 4px solid var(--quaternary-color);
+            }}
+
+            .data-quality-list {{
+                font-size: 0.9rem;
+                padding-left: 1.25rem;
+            }}
+
+            .funding-legend-rank {{
+                font-size: 0.75rem;
+                color: var(--light-text);
+                margin-left: 0.35rem;
+            }}
+
             .trend-positive {{
                 color: var(--tertiary-color);
             }}
@@ -715,68 +2222,15 @@ def generate_dashboard(selected_location):
                     <div class="dashboard-location-badge">
                         <i class="fas fa-map-marker-alt me-2"></i>{selected_location}
                     </div>
-                    <p class="dashboard-subtitle">Financial Health Expenditure Analysis <span class="time-period">2003-2021</span></p>
+                    <p class="dashboard-subtitle">Financial Health Expenditure Analysis <span class="time-period">{earliest_year}-{latest_year}</span></p>
                 </div>
             </div>
 
             <!-- Key Statistics -->
-            <div class="row">
-                <div class="col-md-3 mb-4">
-                    <div class="stat-card card-hover-effect">
-                        <div class="stat-card-title">
-                            <div class="icon-circle">
-                                <i class="fas fa-chart-line"></i>
-                            </div>
-                            Total Health Expenditure
-                        </div>
-                        <div class="stat-card-value">${latest_the_millions:,.1f}M</div>
-                        <div class="stat-card-subtitle">Recorded in {latest_year}</div>
-                    </div>
-                </div>
-
-                <div class="col-md-3 mb-4">
-                    <div class="stat-card card-hover-effect">
-                        <div class="stat-card-title">
-                            <div class="icon-circle">
-                                <i class="fas fa-percentage"></i>
-                            </div>
-                            Overall Growth
-                        </div>
-                        <div class="stat-card-value {'trend-positive' if percent_change >= 0 else 'trend-negative'}">
-                            {'+' if percent_change >= 0 else ''}{percent_change:.1f}%
-                        </div>
-                        <div class="stat-card-subtitle">Since {earliest_year}</div>
-                    </div>
-                </div>
-
-                <div class="col-md-3 mb-4">
-                    <div class="stat-card card-hover-effect">
-                        <div class="stat-card-title">
-                            <div class="icon-circle">
-                                <i class="fas fa-calendar-day"></i>
-                            </div>
-                            Annual Growth Rate
-                        </div>
-                        <div class="stat-card-value {'trend-positive' if avg_annual_growth >= 0 else 'trend-negative'}">
-                            {'+' if avg_annual_growth >= 0 else ''}{avg_annual_growth:.1f}%
-                        </div>
-                        <div class="stat-card-subtitle">Average per year</div>
-                    </div>
-                </div>
+            {stat_cards_html}
 
-                <div class="col-md-3 mb-4">
-                    <div class="stat-card card-hover-effect">
-                        <div class="stat-card-title">
-                            <div class="icon-circle">
-                                <i class="fas fa-clock"></i>
-                            </div>
-                            Study Period
-                        </div>
-                        <div class="stat-card-value">{years_span} years</div>
-                        <div class="stat-card-subtitle">{earliest_year} to {latest_year}</div>
-                    </div>
-                </div>
-            </div>
+            <!-- Data Quality Notes -->
+            {data_quality_html}
 
             <!-- Funding Composition Section -->
             <div class="row">
@@ -804,6 +2258,7 @@ def generate_dashboard(selected_location):
                                 <div class="funding-legend-item">
                                     <div class="funding-legend-color" style="background-color: {'#EF4444' if 'ghes' in k else '#10B981' if 'ppp' in k else '#F59E0B' if 'oop' in k else '#8B5CF6'}"></div>
                                     <span>{'Government' if 'ghes' in k else 'Private Plans' if 'ppp' in k else 'Out-of-Pocket' if 'oop' in k else 'Development Aid'}: {v:.1f}%</span>
+                                    <span class="funding-legend-rank">{format_rank(funding_ranks[k])}</span>
                                 </div>
                                 """
         for k, v in funding_percentages.items()
@@ -818,11 +2273,10 @@ def generate_dashboard(selected_location):
                 <div class="d-flex justify-content-between align-items-center mb-3">
                     <h2 class="chart-title m-0">Health Financing Trends Over Time</h2>
                     <div>
-                        <span class="source-tag source-the">THE</span>
-                        <span class="source-tag source-ghes">GHES</span>
-                        <span class="source-tag source-ppp">PPP</span>
-                        <span class="source-tag source-oop">OOP</span>
-                        <span class="source-tag source-dah">DAH</span>
+                        {''.join([
+        f'<span class="source-tag source-{column.split("_")[0]}">{column.split("_")[0].upper()}</span>'
+        for _, column, _ in funding_sources
+    ])}
                     </div>
                 </div>
                 <div id="boxplot-chart" style="width:100%; height:550px;"></div>
@@ -976,25 +2430,486 @@ def generate_dashboard(selected_location):
     return html_content
 
 
-# Get unique locations
-locations = sorted(df['location_name'].unique())
-print("Available locations:")
-for i, loc in enumerate(locations):
-    print(f"  {i + 1}. {loc}")
+# Function to get the output file name of a location's dashboard
+def dashboard_filename(selected_location):
+    return f"health_financing_dashboard_{selected_location.lower().replace(' ', '_')}.html"
+
+
+# Function to render a dashboard into output_dir (the current directory when None);
+# returns the file name, or None when there is no data
+def save_dashboard(selected_location, output_dir=None, **options):
+    html_content = generate_dashboard(selected_location, **options)
+    if not html_content:
+        return None
+
+    output_filename = dashboard_filename(selected_location)
+    if output_dir is not None:
+        output_filename = os.path.join(output_dir, output_filename)
+    with open(output_filename, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+    return output_filename
+
+
+# Function to compute the headline numbers of every location at once from the data cube:
+# latest total health expenditure, overall percent change and average annual growth over the
+# year window, with the same definitions as the stat cards
+def build_location_stats(year_range=DEFAULT_YEAR_RANGE, variant='nominal'):
+    cube = get_cube(variant)
+    first, last, has_data = window_bounds(cube, year_range)
+
+    the_values = cube['values'][:, :, cube['measure_index']['the_total_mean'] * len(CUBE_STATS)]
+    rows = np.arange(len(cube['locations']))
+    earliest_the = the_values[rows, first].astype(float)
+    latest_the = the_values[rows, last].astype(float)
+    years_span = cube['years'][last] - cube['years'][first]
+
+    # Growth is undefined when the first total is zero, negative or missing
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valid_base = (earliest_the > 0) & np.isfinite(latest_the)
+        percent_change = np.where(valid_base, (latest_the - earliest_the) / earliest_the * 100, np.nan)
+        avg_annual_growth = np.where(
+            valid_base & (latest_the >= 0) & (years_span > 0),
+            ((latest_the / earliest_the) ** (1 / np.where(years_span > 0, years_span, 1)) - 1) * 100,
+            np.nan
+        )
+
+    stats = pd.DataFrame({
+        'location_name': cube['locations'],
+        'earliest_year': cube['years'][first],
+        'latest_year': cube['years'][last],
+        'latest_the': latest_the,
+        'percent_change': percent_change,
+        'avg_annual_growth': avg_annual_growth
+    })
+
+    return stats[has_data].reset_index(drop=True)
+
+
+# Function to write index.html into output_dir: a searchable, sortable catalogue of the
+# dashboards. The whole catalogue is embedded as one compact JSON blob and filtered and
+# sorted in the browser, so no dashboard has to be opened to find a location.
+def generate_index(output_dir='.', year_range=DEFAULT_YEAR_RANGE, variant='nominal', locations=None):
+    stats = build_location_stats(year_range, variant)
+    if locations is not None:
+        stats = stats[stats['location_name'].isin(locations)]
+
+    unit = NORMALIZATION_VARIANTS[variant]['unit']
+    numbers = stats[['latest_the', 'percent_change', 'avg_annual_growth']].round(1).astype(object)
+    numbers = numbers.where(np.isfinite(stats[['latest_the', 'percent_change', 'avg_annual_growth']]), None)
+    catalogue = {
+        'columns': ['name', 'file', 'year', 'the', 'change', 'cagr'],
+        'rows': [
+            [name, quote(dashboard_filename(name)), int(year), the, change, cagr]
+            for name, year, (the, change, cagr) in zip(
+                stats['location_name'], stats['latest_year'], numbers.itertuples(index=False, name=None))
+        ]
+    }
+    # Keep '</script>' in a location name from closing the script tag
+    catalogue_json = json.dumps(catalogue, separators=(',', ':'), ensure_ascii=False).replace('</', '<\\/')
+
+    first_year, last_year = (
+        (stats['earliest_year'].min(), stats['latest_year'].max()) if len(stats) else year_range or ('', '')
+    )
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Health Financing Dashboards</title>
+
+        <!-- Google Fonts -->
+        <link rel="preconnect" href="https://fonts.googleapis.com">
+        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&family=Merriweather:wght@300;400;700;900&display=swap" rel="stylesheet">
+
+        <!-- Modern UI Libraries -->
+        <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css">
+
+        <!-- Custom Styling -->
+        <style>
+            :root {{
+                --primary-color: #3B82F6;
+                --secondary-color: #EF4444;
+                --tertiary-color: #10B981;
+                --light-bg: #F9FAFB;
+                --dark-bg: #111827;
+                --text-color: #1F2937;
+                --light-text: #6B7280;
+                --header-font: 'Merriweather', serif;
+                --body-font: 'Inter', sans-serif;
+                --shadow-md: 0 4px 6px rgba(0,0,0,0.05), 0 1px 3px rgba(0,0,0,0.1);
+                --rounded-md: 0.375rem;
+            }}
+
+            body {{
+                font-family: var(--body-font);
+                color: var(--text-color);
+                background: linear-gradient(135deg, var(--light-bg) 0%, #eef2f7 100%);
+                min-height: 100vh;
+            }}
+
+            h1 {{
+                font-family: var(--header-font);
+                font-weight: 700;
+                color: var(--dark-bg);
+            }}
+
+            .index-container {{
+                max-width: 1280px;
+                margin: 0 auto;
+                padding: 2rem;
+            }}
+
+            .index-card {{
+                background: white;
+                border-radius: var(--rounded-md);
+                box-shadow: var(--shadow-md);
+                padding: 1.5rem;
+                border: 1px solid rgba(229, 231, 235, 0.5);
+            }}
+
+            .index-table th {{
+                cursor: pointer;
+                user-select: none;
+                white-space: nowrap;
+                font-size: 0.85rem;
+                text-transform: uppercase;
+                letter-spacing: 0.05em;
+                color: var(--light-text);
+            }}
+
+            .index-table th.sorted-asc::after {{ content: ' \\25B2'; }}
+            .index-table th.sorted-desc::after {{ content: ' \\25BC'; }}
+
+            .index-table a {{
+                color: var(--primary-color);
+                font-weight: 600;
+                text-decoration: none;
+            }}
+
+            .trend-positive {{
+                color: var(--tertiary-color);
+            }}
+
+            .trend-negative {{
+                color: var(--secondary-color);
+            }}
+        </style>
+    </head>
+    <body>
+        <div class="index-container">
+            <h1 class="mb-1">Health Financing Dashboards</h1>
+            <p class="text-muted">IHME Health Spending, {first_year}-{last_year}</p>
+
+            <div class="index-card">
+                <input id="search" class="form-control mb-3" type="search" placeholder="Search locations" autofocus>
+                <p class="small text-muted" id="summary"></p>
+                <div class="table-responsive">
+                    <table class="table table-hover index-table mb-0">
+                        <thead>
+                            <tr>
+                                <th data-column="0">Location</th>
+                                <th data-column="2" class="text-end">Latest Year</th>
+                                <th data-column="3" class="text-end">Total Health Expenditure</th>
+                                <th data-column="4" class="text-end">Overall Growth</th>
+                                <th data-column="5" class="text-end">Annual Growth Rate</th>
+                            </tr>
+                        </thead>
+                        <tbody id="rows"></tbody>
+                    </table>
+                </div>
+            </div>
+
+            <div class="text-center text-muted small mt-4">
+                Created with Plotly and Python | Generated on {datetime.now().strftime('%Y-%m-%d')}
+            </div>
+        </div>
 
-# Get user input for location
-selected_location = input("\nPlease select a location from the list above: ")
-# Handle both direct name input and numeric selection
-if selected_location.isdigit() and 1 <= int(selected_location) <= len(locations):
-    selected_location = locations[int(selected_location) - 1]
+        <script type="application/json" id="catalogue">{catalogue_json}</script>
+        <script>
+            const catalogue = JSON.parse(document.getElementById('catalogue').textContent);
+            const rows = catalogue.rows;
+            const limit = 500;
 
-# Generate the dashboard
-html_content = generate_dashboard(selected_location)
+            // Accent- and case-insensitive search keys, computed once
+            const keys = rows.map(row => row[0].normalize('NFD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase());
+
+            let sortColumn = 0;
+            let sortDescending = false;
+            let order = rows.map((_, i) => i);
+
+            function escapeHtml(text) {{
+                return text.replace(/[&<>"']/g, ch => ({{'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}})[ch]);
+            }}
+
+            function formatChange(value) {{
+                if (value === null) return '<span class="text-muted">n/a</span>';
+                const cls = value >= 0 ? 'trend-positive' : 'trend-negative';
+                return `<span class="${{cls}}">${{value >= 0 ? '+' : ''}}${{value.toFixed(1)}}%</span>`;
+            }}
+
+            function formatTotal(value) {{
+                if (value === null) return '<span class="text-muted">n/a</span>';
+                return '$' + value.toLocaleString(undefined, {{minimumFractionDigits: 1, maximumFractionDigits: 1}}) + '{unit}';
+            }}
+
+            function sortRows() {{
+                const direction = sortDescending ? -1 : 1;
+                order.sort((a, b) => {{
+                    const x = rows[a][sortColumn];
+                    const y = rows[b][sortColumn];
+                    if (x === null) return 1;
+                    if (y === null) return -1;
+                    if (typeof x === 'string') return direction * x.localeCompare(y);
+                    return direction * (x - y);
+                }});
+                document.querySelectorAll('.index-table th').forEach(th => {{
+                    th.classList.remove('sorted-asc', 'sorted-desc');
+                    if (Number(th.dataset.column) === sortColumn) {{
+                        th.classList.add(sortDescending ? 'sorted-desc' : 'sorted-asc');
+                    }}
+                }});
+            }}
 
-if html_content:
-    # Save to HTML file
-    output_filename = f"health_financing_dashboard_{selected_location.lower().replace(' ', '_')}.html"
+            function render() {{
+                const query = document.getElementById('search').value
+                    .normalize('NFD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase().trim();
+                const matches = query ? order.filter(i => keys[i].includes(query)) : order;
+
+                document.getElementById('rows').innerHTML = matches.slice(0, limit).map(i => {{
+                    const row = rows[i];
+                    return `<tr>
+                        <td><a href="${{row[1]}}">${{escapeHtml(row[0])}}</a></td>
+                        <td class="text-end">${{row[2]}}</td>
+                        <td class="text-end">${{formatTotal(row[3])}}</td>
+                        <td class="text-end">${{formatChange(row[4])}}</td>
+                        <td class="text-end">${{formatChange(row[5])}}</td>
+                    </tr>`;
+                }}).join('');
+
+                document.getElementById('summary').textContent = matches.length > limit
+                    ? `Showing ${{limit}} of ${{matches.length}} matching locations (${{rows.length}} in total)`
+                    : `${{matches.length}} of ${{rows.length}} locations`;
+            }}
+
+            document.getElementById('search').addEventListener('input', render);
+            document.querySelectorAll('.index-table th').forEach(th => {{
+                th.addEventListener('click', () => {{
+                    const column = Number(th.dataset.column);
+                    sortDescending = column === sortColumn ? !sortDescending : column !== 0;
+                    sortColumn = column;
+                    sortRows();
+                    render();
+                }});
+            }});
+
+            sortRows();
+            render();
+        </script>
+    </body>
+    </html>
+    """
+
+    output_filename = os.path.join(output_dir, 'index.html')
     with open(output_filename, 'w', encoding='utf-8') as f:
         f.write(html_content)
-    print(f"\nDashboard saved as '{output_filename}'")
-    print(f"Open this file in your web browser to view the interactive dashboard for {selected_location}.")
+
+    return output_filename
+
+
+# Function to render the dashboards of every location (or the given ones) plus the index page
+def generate_all(output_dir='.', locations=None, **options):
+    os.makedirs(output_dir, exist_ok=True)
+    if locations is None:
+        locations = get_search_index()['names']
+
+    rendered = [name for name in locations if save_dashboard(name, output_dir, **options)]
+    generate_index(
+        output_dir,
+        year_range=options.get('year_range', DEFAULT_YEAR_RANGE),
+        variant=options.get('variant', 'nominal'),
+        locations=rendered
+    )
+
+    return rendered
+
+
+# Function to fingerprint each location's slice of the data cube together with its ranks,
+# to tell which dashboards a reload actually changed. Ranks depend on every other
+# location's data, so a change elsewhere can still alter a dashboard's rank lines.
+def location_fingerprints(variant='nominal'):
+    cube = get_cube(variant)
+    rankings = get_rankings(variant)
+    common = cube['years'].tobytes() + rankings['count'].tobytes()
+
+    def ranks(i):
+        if 'groups' not in rankings:
+            return rankings['rank'][i].tobytes()
+        group = rankings['group_of'][i]
+        return (rankings['rank'][i].tobytes() + rankings['groups'][group].encode() +
+                rankings['group_rank'][i].tobytes() + rankings['group_count'][group].tobytes())
+
+    return {
+        name: hashlib.sha256(common + cube['values'][i].tobytes() + ranks(i)).hexdigest()
+        for i, name in enumerate(cube['locations'])
+    }
+
+
+def _snapshot(path):
+    snapshot = {}
+    for file in data_files(path):
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:  # Removed between listing and stat
+            continue
+        snapshot[file] = (stat.st_mtime_ns, stat.st_size)
+
+    return snapshot
+
+
+# Function to prepare the loaded data the same way for every run: regional rollups are
+# added when a location hierarchy is available
+def _prepare_data(path, hierarchy=None, workers=None):
+    load_data(path, workers)
+    if hierarchy is not None:
+        apply_hierarchy(hierarchy)
+
+
+# Function to keep dashboards up to date with a data file or directory. The files are polled
+# every interval seconds; once a change is seen, the reload waits until the files have been
+# stable for debounce seconds (so half-written extracts are not read). Only changed files are
+# re-parsed and only dashboards whose location data changed are re-rendered. locations limits
+# the dashboards kept up to date (None for all) and workers the processes used for parsing.
+def watch(path, output_dir='.', locations=None, interval=2.0, debounce=1.0, workers=None, **options):
+    os.makedirs(output_dir, exist_ok=True)
+    hierarchy = load_hierarchy(HIERARCHY_FILE) if os.path.exists(HIERARCHY_FILE) else None
+    variant = options.get('variant', 'nominal')
+
+    _prepare_data(path, hierarchy, workers)
+    snapshot = _snapshot(path)
+    fingerprints = location_fingerprints(variant)
+
+    def render(names):
+        rendered = 0
+        for name in names:
+            if locations is None or name in locations:
+                if save_dashboard(name, output_dir, **options):
+                    rendered += 1
+        return rendered
+
+    def render_index():
+        generate_index(
+            output_dir,
+            year_range=options.get('year_range', DEFAULT_YEAR_RANGE),
+            variant=variant,
+            locations=locations
+        )
+
+    print(f"Rendered {render(sorted(fingerprints))} dashboards.", end=' ')
+    render_index()
+    print(f"Watching {', '.join(data_files(path))} for changes (Ctrl+C to stop).")
+
+    try:
+        while True:
+            time.sleep(interval)
+            current = _snapshot(path)
+            if current == snapshot:
+                continue
+
+            # Debounce: wait until the files stop changing
+            while True:
+                time.sleep(debounce)
+                settled = _snapshot(path)
+                if settled == current:
+                    break
+                current = settled
+            snapshot = current
+
+            try:
+                _prepare_data(path, hierarchy, workers)
+            except Exception as error:  # Keep watching; the next change may fix the file
+                print(f"Could not reload {path}: {error}")
+                continue
+
+            new_fingerprints = location_fingerprints(variant)
+            changed = sorted(name for name, fingerprint in new_fingerprints.items()
+                             if fingerprints.get(name) != fingerprint)
+            fingerprints = new_fingerprints
+
+            print(f"{datetime.now().strftime('%H:%M:%S')} Data changed: "
+                  f"re-rendered {render(changed)} of {len(new_fingerprints)} dashboards.")
+            render_index()
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate health financing dashboards.')
+    parser.add_argument('--data', nargs='+', default=[DATA_FILE],
+                        help='CSV files, directories of CSV files or glob patterns')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes used to parse the CSV files (default: one per CPU)')
+    parser.add_argument('--benchmark-load', action='store_true',
+                        help='time loading the data with 1, 4 and 8 workers, then exit')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and re-render dashboards whenever the data changes')
+    parser.add_argument('--all', action='store_true',
+                        help='render the dashboards of every location plus a searchable index.html, then exit')
+    parser.add_argument('--output-dir', default='.', help='directory for the dashboards in watch and --all mode')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between checks in watch mode')
+    args = parser.parse_args()
+
+    # Use draw-level uncertainty when a draw store has been built
+    draw_store = load_draw_store() if os.path.exists(DRAW_STORE_DIR) else None
+    load_reference_tables()
+
+    if args.benchmark_load:
+        print("Loading time:")
+        benchmark_load(args.data)
+        raise SystemExit
+
+    if args.watch:
+        watch(args.data, args.output_dir, interval=args.interval, workers=args.workers, draw_store=draw_store)
+        raise SystemExit
+
+    # Load data from CSV file
+    load_data(args.data, args.workers)
+
+    # Summarize the data-quality scan for the years the dashboards show
+    report = issues_in_window(get_validation_report(), DEFAULT_YEAR_RANGE)
+    if not report.empty:
+        print(f"Data quality: {len(report)} issues in {report['location_name'].nunique()} locations "
+              f"({DEFAULT_YEAR_RANGE[0]}-{DEFAULT_YEAR_RANGE[1]})")
+        for check, count in report['check'].value_counts().items():
+            print(f"  {check}: {count}")
+
+    # Add regional rollups when a location hierarchy is available
+    if os.path.exists(HIERARCHY_FILE):
+        apply_hierarchy(load_hierarchy(HIERARCHY_FILE))
+
+    if args.all:
+        rendered = generate_all(args.output_dir, draw_store=draw_store)
+        print(f"Rendered {len(rendered)} dashboards and '{os.path.join(args.output_dir, 'index.html')}'")
+        raise SystemExit
+
+    # Get unique locations
+    locations = get_search_index()['names']
+    print(f"{len(locations)} locations available. Type a name (Tab to autocomplete, misspellings are fine).")
+
+    if readline is not None:
+        readline.set_completer(_complete_location)
+        readline.set_completer_delims('')
+        readline.parse_and_bind('tab: complete')
+
+    # Get user input for location
+    selected_location = resolve_location(input("\nPlease select a location: "))
+
+    # Generate the dashboard and save it to an HTML file
+    output_filename = save_dashboard(selected_location, draw_store=draw_store)
+
+    if output_filename:
+        print(f"\nDashboard saved as '{output_filename}'")
+        print(f"Open this file in your web browser to view the interactive dashboard for {selected_location}.")